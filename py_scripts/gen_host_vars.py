@@ -7,9 +7,26 @@ Generates host_vars, group_vars, and inventory files for your topology:
 - Selective VLAN stretching between buildings
 """
 
+import ipaddress
 import os
+import re
 import yaml
-from pathlib import Path
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+
+# Prefer the libyaml C emitter when PyYAML was built with it
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Strings the host_vars emitter may write unquoted, as long as YAML would
+# also resolve them back to a string (not a number, bool or null)
+PLAIN_SCALAR_RE = re.compile(r"[\w./(][\w./()-]*(?: [\w./()-]+)*")
+YAML_RESOLVER = yaml.resolver.Resolver()
+
+# Line width that keeps quoted scalars on one line (libyaml needs a C int)
+YAML_MAX_WIDTH = 2**31 - 1
 
 # Device data from your CSV (update with actual management IPs if needed)
 devices_data = [
@@ -38,49 +55,74 @@ devices_data = [
     {"hostname": "dub-st3-lf2", "loopback0": "10.10.10.16", "loopback1": "20.20.20.16", "mgmt": "1.1.1.16"},
 ]
 
-def determine_device_type(hostname):
-    """Determine device type from hostname"""
-    if "-ssp" in hostname:
-        return "superspine"
-    elif "-sp" in hostname and "-ssp" not in hostname:
-        return "spine"
-    elif "-lf" in hostname:
-        return "leaf"
-    else:
-        return "unknown"
-
-def extract_building(hostname):
-    """Extract building/area from hostname (st1, st2, st3)"""
-    if "-st1-" in hostname:
-        return "st1"
-    elif "-st2-" in hostname:
-        return "st2"
-    elif "-st3-" in hostname:
-        return "st3"
-    else:
+# VLANs per building based on your selective stretching design
+BUILDING_VLANS = {
+    "st1": (100, 200, 300),  # Building 1: VLANs 100↔st3, 200↔st2, 300↔all
+    "st2": (200, 300, 400),  # Building 2: VLANs 200↔st1, 300↔all, 400↔st3
+    "st3": (100, 300, 400)   # Building 3: VLANs 100↔st1, 300↔all, 400↔st2
+}
+
+# VLAN to VNI mappings per building (VNI = VLAN + 10000), read-only because
+# every VTEP in a building shares the same mapping object
+VNI_MAPPINGS = {
+    building: MappingProxyType({vlan: vlan + 10000 for vlan in vlans})
+    for building, vlans in BUILDING_VLANS.items()
+}
+
+# Hostname layout: dub-sspN for superspines, dub-stX-spN / dub-stX-lfN inside a building
+HOSTNAME_RE = re.compile(r"dub-(?:ssp\d+|(st[123])-(sp|lf)\d+)$")
+ROLE_TYPES = {"sp": "spine", "lf": "leaf", None: "superspine"}
+
+def parse_hostname(hostname):
+    """Return (device_type, building) for a hostname with a single regex match"""
+    match = HOSTNAME_RE.match(hostname)
+    if not match:
+        return "unknown", None
+    building, role = match.groups()
+    return ROLE_TYPES[role], building
+
+class Device(NamedTuple):
+    """A device from devices_data with its hostname already parsed"""
+    hostname: str
+    loopback0: str
+    loopback1: Optional[str]
+    mgmt: str
+    device_type: str
+    building: Optional[str]
+
+def check_ipv4(device, field):
+    """Return a device's IPv4 address field, failing early on a malformed entry"""
+    if device.get(field) is None:
         return None
+    try:
+        return str(ipaddress.IPv4Address(device[field]))
+    except ValueError:
+        raise ValueError(f"{device['hostname']}: {field} {device[field]!r} is not a valid IPv4 address") from None
+
+def build_devices(devices):
+    """Turn the raw device dicts into Device tuples, parsing each hostname once"""
+    return tuple(
+        Device(d["hostname"], check_ipv4(d, "loopback0"), check_ipv4(d, "loopback1"),
+               d.get("mgmt", "ansible_host_not_set"), *parse_hostname(d["hostname"]))
+        for d in devices
+    )
 
 def get_building_vlans(building):
     """Get VLAN list for each building based on your selective stretching design"""
-    vlan_mapping = {
-        "st1": [100, 200, 300],  # Building 1: VLANs 100↔st3, 200↔st2, 300↔all
-        "st2": [200, 300, 400],  # Building 2: VLANs 200↔st1, 300↔all, 400↔st3  
-        "st3": [100, 300, 400]   # Building 3: VLANs 100↔st1, 300↔all, 400↔st2
-    }
-    return vlan_mapping.get(building, [])
+    return BUILDING_VLANS.get(building, ())
 
 def generate_host_vars(device):
     """Generate host_vars dictionary for a device"""
-    hostname = device["hostname"]
-    device_type = determine_device_type(hostname)
-    building = extract_building(hostname)
+    hostname = device.hostname
+    device_type = device.device_type
+    building = device.building
     
     # Base configuration for all devices
     host_vars = {
         "# Device identification": None,
         "hostname": hostname,
         "device_type": device_type,
-        "router_id": device["loopback0"],
+        "router_id": device.loopback0,
         
         "# Routing parameters": None,
         "ospf_process_id": 1,
@@ -99,27 +141,29 @@ def generate_host_vars(device):
             "loopback_interfaces": {
                 "loopback0": {
                     "description": "Router-ID for OSPF and BGP Route Reflector",
-                    "ip_address": f"{device['loopback0']}/32"
+                    "ip_address": f"{device.loopback0}/32"
                 }
             }
         })
     
     # Spines and Leafs: VTEP functionality + BGP clients
     else:
+        if device.loopback1 is None:
+            raise ValueError(f"{hostname}: VTEP devices need a loopback1 address")
         host_vars.update({
             "# VTEP configuration": None,
-            "vtep_ip": device["loopback1"],
+            "vtep_ip": device.loopback1,
             "bgp_role": "route_reflector_client",
             
             "# Loopback interfaces (VTEP enabled)": None,
             "loopback_interfaces": {
                 "loopback0": {
                     "description": "Router-ID for OSPF and BGP",
-                    "ip_address": f"{device['loopback0']}/32"
+                    "ip_address": f"{device.loopback0}/32"
                 },
                 "loopback1": {
                     "description": "VTEP Loopback for VXLAN", 
-                    "ip_address": f"{device['loopback1']}/32"
+                    "ip_address": f"{device.loopback1}/32"
                 }
             }
         })
@@ -133,46 +177,144 @@ def generate_host_vars(device):
             "vlans": building_vlans
         })
         
-        # Add VNI mappings for VTEP devices only
+        # Add VNI mappings for VTEP devices only (shared per building, not copied)
         if device_type in ["spine", "leaf"] and building_vlans:
             host_vars.update({
                 "# VLAN to VNI mappings": None,
-                "vni_mappings": {
-                    vlan: vlan + 10000 for vlan in building_vlans
-                }
+                "vni_mappings": VNI_MAPPINGS[building]
             })
     
     return host_vars
 
-def create_host_vars_files(devices, output_dir="host_vars"):
-    """Create individual host_vars files for each device"""
-    
-    # Create output directory
-    Path(output_dir).mkdir(exist_ok=True)
+def render_yaml_document(data):
+    """Render a vars dictionary as one YAML document, keeping "# ..." section comments"""
+    
+    # Split comment sentinels (None values) from the real variables, keeping
+    # the list of comments that comes right before each key
+    variables = {}
+    commented_keys = []
+    comments = []
+    for key, value in data.items():
+        if value is None:
+            comments.append(key)
+        else:
+            variables[key] = value
+            if comments:
+                commented_keys.append((key, comments))
+                comments = []
+    trailing_comments = comments
+    
+    dump_options = {"Dumper": YamlDumper, "default_flow_style": False, "sort_keys": False}
+    
+    # Render the commented keys as mapping keys, exactly the way the emitter
+    # writes them in the document (quoted, or as "? " complex keys when long),
+    # so they can be found at the start of their lines
+    rendered_keys = []
+    if commented_keys:
+        keys_dump = yaml.dump({key: 0 for key, _ in commented_keys}, indent=2, **dump_options)
+        for line in keys_dump.splitlines():
+            if line.startswith("? "):
+                rendered_keys.append(line)
+            elif line and line[0] != " " and not line.startswith(": "):
+                rendered_keys.append(line[:-len(" 0")])
+    
+    # Serialize everything in a single dump, then put the comments back
+    # in front of the top-level keys they belong to
+    dumped = yaml.dump(variables, indent=2, **dump_options)
+    parts = ["---\n"]
+    next_comment = 0
+    for line in dumped.splitlines(keepends=True):
+        if next_comment < len(rendered_keys) and line.startswith(rendered_keys[next_comment]):
+            for comment in commented_keys[next_comment][1]:
+                parts.append(f"\n{comment}\n")
+            next_comment += 1
+        parts.append(line)
+    
+    if next_comment != len(commented_keys) or len(rendered_keys) != len(commented_keys):
+        missing = [key for key, _ in commented_keys[next_comment:]]
+        raise ValueError(f"Could not place section comments before keys: {missing}")
+    
+    parts.extend(f"\n{comment}\n" for comment in trailing_comments)
+    return "".join(parts)
+
+def yaml_scalar(value):
+    """Format a scalar for YAML, quoting strings that would not read back as the same plain string"""
+    if not isinstance(value, str):
+        return str(value)
+    if PLAIN_SCALAR_RE.fullmatch(value) and \
+            YAML_RESOLVER.resolve(yaml.ScalarNode, value, (True, False)) == "tag:yaml.org,2002:str":
+        return value
+    # Let PyYAML write the double-quoted form so every character is escaped
+    # the way YAML (not JSON) expects, and keep it on a single line
+    quoted = yaml.dump(value, Dumper=YamlDumper, default_style='"',
+                       width=YAML_MAX_WIDTH, allow_unicode=True)
+    return quoted.rstrip("\n")
+
+def render_host_vars_file(device):
+    """Render the host_vars YAML document for a single device
+    
+    host_vars only ever holds scalars, VLAN lists and nested dicts, so it is
+    emitted directly instead of going through PyYAML.
+    """
+    lines = ["---\n"]
+    for key, value in generate_host_vars(device).items():
+        if value is None:
+            lines.append(f"\n{key}\n")
+        elif isinstance(value, Mapping) and not value:
+            lines.append(f"{key}: {{}}\n")
+        elif isinstance(value, Mapping):
+            lines.append(f"{key}:\n")
+            for sub_key, sub_value in value.items():
+                if isinstance(sub_value, Mapping) and not sub_value:
+                    lines.append(f"  {sub_key}: {{}}\n")
+                elif isinstance(sub_value, Mapping):
+                    lines.append(f"  {sub_key}:\n")
+                    lines.extend(f"    {k}: {yaml_scalar(v)}\n" for k, v in sub_value.items())
+                else:
+                    lines.append(f"  {sub_key}: {yaml_scalar(sub_value)}\n")
+        elif isinstance(value, (list, tuple)) and not value:
+            lines.append(f"{key}: []\n")
+        elif isinstance(value, (list, tuple)):
+            lines.append(f"{key}:\n")
+            lines.extend(f"- {yaml_scalar(item)}\n" for item in value)
+        else:
+            lines.append(f"{key}: {yaml_scalar(value)}\n")
+    return "".join(lines)
+
+def write_files(pending):
+    """Write all generated (path, content) pairs in one batch"""
+    
+    def write_one(item):
+        path, content = item
+        with open(path, 'w') as f:
+            f.write(content)
+    
+    # Create every output directory once, before any file is written
+    for directory in {os.path.dirname(path) for path, _ in pending}:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    # Every entry is an independent file, so the writes can overlap
+    with ThreadPoolExecutor(max_workers=min(32, len(pending) or 1)) as executor:
+        list(executor.map(write_one, pending))
+
+def render_host_vars_files(devices, output_dir="host_vars"):
+    """Render individual host_vars files for each device as (path, content) pairs"""
     
-    print(f"Creating host_vars files in {output_dir}/")
+    # Resolve the output directory to a plain string once
+    out_dir = os.fspath(output_dir)
     
     # Generate files for each device
+    pending = []
     for device in devices:
-        hostname = device["hostname"]
-        host_vars = generate_host_vars(device)
-        
-        # Write YAML file with proper formatting
-        file_path = Path(output_dir) / f"{hostname}.yml"
-        with open(file_path, 'w') as f:
-            f.write("---\n")
-            for key, value in host_vars.items():
-                if value is None:
-                    f.write(f"\n{key}\n")
-                else:
-                    yaml.dump({key: value}, f, default_flow_style=False, indent=2)
-        
-        print(f"  ✓ {hostname}.yml")
-
-def create_group_vars():
-    """Create group_vars/all.yml with global parameters"""
+        hostname = device.hostname
+        file_path = f"{out_dir}/{hostname}.yml"
+        pending.append((file_path, render_host_vars_file(device)))
     
-    Path("group_vars").mkdir(exist_ok=True)
+    return pending
+
+def render_group_vars():
+    """Render group_vars/all.yml with global parameters as (path, content) pairs"""
     
     group_vars = {
         "# Global network parameters": None,
@@ -218,61 +360,45 @@ def create_group_vars():
         "ansible_ssh_common_args": "-o StrictHostKeyChecking=no"
     }
     
-    file_path = Path("group_vars") / "all.yml"
-    with open(file_path, 'w') as f:
-        f.write("---\n")
-        for key, value in group_vars.items():
-            if value is None:
-                f.write(f"\n{key}\n")
-            else:
-                yaml.dump({key: value}, f, default_flow_style=False, indent=2)
-    
-    print("✓ group_vars/all.yml")
+    return [("group_vars/all.yml", render_yaml_document(group_vars))]
 
-def create_inventory_file(devices):
-    """Create inventory.ini file with proper grouping"""
+def render_inventory_file(devices):
+    """Render inventory.ini file with proper grouping as (path, content) pairs"""
     
-    # Categorize devices
-    superspines = [d for d in devices if determine_device_type(d["hostname"]) == "superspine"]
-    spines = [d for d in devices if determine_device_type(d["hostname"]) == "spine"]
-    leafs = [d for d in devices if determine_device_type(d["hostname"]) == "leaf"]
-    
-    # Group by building
-    buildings = {"st1": [], "st2": [], "st3": []}
+    # Categorize devices by type and building in a single pass
+    device_groups = {"superspine": [], "spine": [], "leaf": []}
+    buildings = {building: [] for building in BUILDING_VLANS}
     for device in devices:
-        building = extract_building(device["hostname"])
-        if building:
-            buildings[building].append(device)
+        if device.device_type in device_groups:
+            device_groups[device.device_type].append(device)
+        if device.building:
+            buildings[device.building].append(device)
+    
+    def host_lines(group):
+        return (f"{d.hostname} ansible_host={d.mgmt}\n"
+                for d in group)
     
-    inventory_content = """# Multi-Building Campus EVPN Lab Inventory
+    # Collect the file as a list of chunks and join once at the end
+    parts = ["""# Multi-Building Campus EVPN Lab Inventory
 # 4 Superspines + 3 Buildings with selective VLAN stretching
 
 [superspines]
-"""
-    
-    for device in superspines:
-        mgmt_ip = device.get('mgmt', 'ansible_host_not_set')
-        inventory_content += f"{device['hostname']} ansible_host={mgmt_ip}\n"
+"""]
+    parts.extend(host_lines(device_groups["superspine"]))
     
-    inventory_content += "\n[spines]\n"
-    for device in spines:
-        mgmt_ip = device.get('mgmt', 'ansible_host_not_set')
-        inventory_content += f"{device['hostname']} ansible_host={mgmt_ip}\n"
+    parts.append("\n[spines]\n")
+    parts.extend(host_lines(device_groups["spine"]))
     
-    inventory_content += "\n[leafs]\n"
-    for device in leafs:
-        mgmt_ip = device.get('mgmt', 'ansible_host_not_set')
-        inventory_content += f"{device['hostname']} ansible_host={mgmt_ip}\n"
+    parts.append("\n[leafs]\n")
+    parts.extend(host_lines(device_groups["leaf"]))
     
     # Add building-specific groups
     for building, devices_in_building in buildings.items():
         if devices_in_building:
-            inventory_content += f"\n[{building}]\n"
-            for device in devices_in_building:
-                mgmt_ip = device.get('mgmt', 'ansible_host_not_set')
-                inventory_content += f"{device['hostname']} ansible_host={mgmt_ip}\n"
+            parts.append(f"\n[{building}]\n")
+            parts.extend(host_lines(devices_in_building))
     
-    inventory_content += """
+    parts.append("""
 # Hierarchical groups
 [all:children]
 superspines
@@ -296,15 +422,12 @@ st2
 
 [building_st3:children]
 st3
-"""
-    
-    with open("inventory.ini", 'w') as f:
-        f.write(inventory_content)
+""")
     
-    print("✓ inventory.ini")
+    return [("inventory.ini", "".join(parts))]
 
-def create_readme():
-    """Create README with usage instructions"""
+def render_readme():
+    """Render README with usage instructions as (path, content) pairs"""
     
     readme_content = """# Multi-Building Campus EVPN Lab
 Generated Ansible files for your GNS3 lab topology.
@@ -371,10 +494,7 @@ ansible-playbook -i inventory.ini playbook.yml --check
 5. Add access layer configuration per building
 """
     
-    with open("README.md", 'w') as f:
-        f.write(readme_content)
-    
-    print("✓ README.md")
+    return [("README.md", readme_content)]
 
 def main():
     """Main function to generate all Ansible files"""
@@ -386,25 +506,30 @@ def main():
     print()
     
     print(f"Processing {len(devices_data)} devices...")
+    devices = build_devices(devices_data)
     
     # Device breakdown
-    device_counts = {
-        "superspine": len([d for d in devices_data if determine_device_type(d["hostname"]) == "superspine"]),
-        "spine": len([d for d in devices_data if determine_device_type(d["hostname"]) == "spine"]),
-        "leaf": len([d for d in devices_data if determine_device_type(d["hostname"]) == "leaf"])
-    }
+    device_counts = Counter(d.device_type for d in devices)
     
     print(f"  → {device_counts['superspine']} Superspines (Route Reflectors)")
     print(f"  → {device_counts['spine']} Spines (per building)")
     print(f"  → {device_counts['leaf']} Leafs (per building)")
     print()
     
-    # Generate all files
+    # Generate all files in memory, then write them out together
     print("Generating files:")
-    create_host_vars_files(devices_data)
-    create_group_vars()
-    create_inventory_file(devices_data)
-    create_readme()
+    host_vars_dir = "host_vars"
+    host_vars_files = render_host_vars_files(devices, host_vars_dir)
+    other_files = render_group_vars() + render_inventory_file(devices) + render_readme()
+    
+    print(f"Creating host_vars files in {host_vars_dir}/")
+    write_files(host_vars_files + other_files)
+    
+    # Only report files once they have actually been written
+    for path, _ in host_vars_files:
+        print(f"  ✓ {os.path.basename(path)}")
+    for path, _ in other_files:
+        print(f"✓ {path}")
     
     print()
     print("╔═══════════════════════════════════════════════════════╗")